@@ -1,18 +1,67 @@
 """
 Data client for DuckDB with persistent in-memory database.
 Optimized for Hugging Face Spaces deployment.
-Thread-safe: parquet loaded once into memory, shared connection with lock.
+Thread-safe: parquet loaded once into memory, one cursor per query.
 """
 import streamlit as st
 import pandas as pd
 import duckdb
+import pyarrow as pa
 import os
+import glob
+import hashlib
 import threading
-from typing import Optional, Dict, Any, List
+import time
+import uuid
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Tuple
 
 # Path to local parquet file
 PARQUET_PATH = "Data/Data Final Dashboard.parquet"
-DATA_TABLE = "data"
+MUNICIPAL_TABLE = "datos_municipio"
+DEPARTMENTAL_TABLE = "datos_departamento"
+TERRITORIES_TABLE = "territorios"
+LOAD_INFO_TABLE = "carga_parquet"
+
+# DuckDB sizes itself to the host (all cores, 80% of RAM). Set DUCKDB_THREADS
+# or DUCKDB_MEMORY_LIMIT (e.g. "1GB") to cap it on shared or small hosts.
+DUCKDB_THREADS = os.environ.get("DUCKDB_THREADS") or None
+if DUCKDB_THREADS is not None:
+    # Checked here so a bad value fails once at import, naming the variable,
+    # instead of inside the cached _init_db on every session.
+    if not DUCKDB_THREADS.strip().isdigit() or int(DUCKDB_THREADS) < 1:
+        raise ValueError(f"DUCKDB_THREADS debe ser un entero positivo, no {DUCKDB_THREADS!r}")
+    DUCKDB_THREADS = int(DUCKDB_THREADS)
+DUCKDB_MEMORY_LIMIT = os.environ.get("DUCKDB_MEMORY_LIMIT")
+
+# Optional DuckDB database file. Unset: tables are rebuilt in memory from the
+# parquet on every process start. Set: the first start builds them into this
+# file and later starts open it read-only, so app processes on the same host
+# can share it. When the parquet's size or mtime or the load schema below
+# changes, the next process to start rebuilds it in a temporary file and
+# swaps it in with os.replace; processes already running keep reading the
+# old copy until they restart. Relies on POSIX rename semantics, so use a
+# local filesystem on Linux/macOS.
+DUCKDB_PATH = os.environ.get("DUCKDB_PATH")
+# Attempts (with exponential backoff) to open DUCKDB_PATH when another
+# process holds a conflicting lock on it.
+DUCKDB_OPEN_RETRIES = 5
+# Temporary builds untouched for this long (seconds) are treated as left
+# behind by a killed process and removed by the next build.
+DUCKDB_TMP_MAX_AGE = 3600
+
+# Each tipo_territorio lives in its own table, so queries never re-filter on it
+TERRITORY_TABLES = {
+    'Municipio': MUNICIPAL_TABLE,
+    'Departamento': DEPARTMENTAL_TABLE,
+}
+
+# Tables are never modified after load, so cached query results stay valid
+# for the process lifetime; TTL and max_entries only bound cache memory.
+# Row-level results (consultar_datos_filtrados) are large, so keep fewer.
+CACHE_TTL = 3600
+CACHE_MAX_ENTRIES = 128
+CACHE_MAX_ENTRIES_ROWS = 32
 
 # Default columns used by most views (excludes heavy text fields)
 DEFAULT_COLUMNS = [
@@ -28,83 +77,377 @@ DEFAULT_COLUMNS = [
     'IPM_2018', 'PDET', 'Cat_IICA', 'Grupo_MDM'
 ]
 
+# Columns loaded from the parquet; every column a query or view references
+# must be listed here. Anything else in the file is never read into memory.
+COLUMNS_USED = list(DEFAULT_COLUMNS)
 
-@st.cache_resource
-def _init_db():
+# Columns read by the municipal view (no codes, tipo_territorio or ML confidence)
+MUNICIPAL_VIEW_COLUMNS = (
+    'mpio', 'dpto',
+    'recommendation_code', 'recommendation_text',
+    'recommendation_topic', 'recommendation_priority',
+    'sentence_text', 'sentence_similarity',
+    'paragraph_text', 'paragraph_similarity',
+    'paragraph_id', 'page_number',
+    'sentence_id_paragraph', 'predicted_class',
+    'IPM_2018', 'PDET', 'Cat_IICA', 'Grupo_MDM'
+)
+
+# Columns read by the departmental view (socioeconomic fields are municipal-only)
+DEPARTMENTAL_VIEW_COLUMNS = (
+    'dpto',
+    'recommendation_code', 'recommendation_text',
+    'recommendation_topic', 'recommendation_priority',
+    'sentence_text', 'sentence_similarity',
+    'paragraph_text', 'paragraph_similarity',
+    'paragraph_id', 'page_number',
+    'sentence_id_paragraph', 'predicted_class'
+)
+
+# Allowed PDET filter choices and the predicate each one adds
+FILTROS_PDET = {
+    "Todos": None,
+    "Solo PDET": "PDET = 1",
+    "Solo No PDET": "PDET = 0",
+}
+
+# Low-cardinality label columns stored as dictionary-encoded ENUMs
+ENUM_COLUMNS = ['tipo_territorio', 'predicted_class', 'Cat_IICA', 'Grupo_MDM']
+
+# Columns stored narrower than parquet's BIGINT/DOUBLE. Only columns that are
+# never compared against user thresholds: a FLOAT sentence_similarity or
+# IPM_2018 would move rows across the slider bounds.
+NARROW_COLUMNS = {
+    'PDET': 'UTINYINT',
+    'recommendation_priority': 'UTINYINT',
+    'prediction_confidence': 'FLOAT',
+}
+
+
+def _columna_carga(col: str) -> str:
+    """Select expression that loads a parquet column with its storage type."""
+    if col in ENUM_COLUMNS:
+        return f"{col}::{col}_enum AS {col}"
+    if col in NARROW_COLUMNS:
+        return f"{col}::{NARROW_COLUMNS[col]} AS {col}"
+    return col
+
+
+def _lista_carga() -> str:
+    """Select list used to load each territory table from the parquet."""
+    return ", ".join(_columna_carga(col) for col in COLUMNS_USED)
+
+
+def _firma_esquema() -> str:
+    """Hash of the load schema, so a code-side column or type change forces a rebuild."""
+    esquema = repr((_lista_carga(), ENUM_COLUMNS, sorted(TERRITORY_TABLES.items())))
+    return hashlib.sha256(esquema.encode()).hexdigest()
+
+
+def _firma_parquet() -> Optional[Tuple[int, int]]:
+    """(size, mtime_ns) of the parquet, or None if it is not on disk."""
+    if not os.path.exists(PARQUET_PATH):
+        return None
+    info = os.stat(PARQUET_PATH)
+    return info.st_size, info.st_mtime_ns
+
+
+def _tablas_vigentes(conn: duckdb.DuckDBPyConnection) -> bool:
     """
-    One-time load of parquet into an in-memory DuckDB table.
-    Cached for the lifetime of the app process. No extra files on disk.
-    Returns (connection, lock) for thread-safe access.
+    True if every dashboard table exists and was built with the current
+    load schema from the parquet currently on disk. With no parquet
+    present, tables with the current schema are kept.
     """
-    if not os.path.exists(PARQUET_PATH):
+    tablas = [*TERRITORY_TABLES.values(), TERRITORIES_TABLE, LOAD_INFO_TABLE]
+    encontradas = conn.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE list_contains(?, table_name)",
+        [tablas]
+    ).fetchone()[0]
+    if encontradas != len(tablas):
+        return False
+
+    # SELECT * so a file written before a column was added here compares
+    # unequal instead of failing to bind.
+    cargada = conn.execute(f"SELECT * FROM {LOAD_INFO_TABLE}").fetchone()
+    if cargada is None or len(cargada) != 3 or cargada[0] != _firma_esquema():
+        return False
+
+    firma = _firma_parquet()
+    return firma is None or tuple(cargada[1:]) == firma
+
+
+def _cargar_tablas(conn: duckdb.DuckDBPyConnection):
+    """
+    Build the ENUM types, per-territory tables and territory dimension
+    from the parquet, replacing any previous load. Runs in one transaction,
+    so a persistent database never keeps a half-finished load.
+    """
+    firma = _firma_parquet()
+    if firma is None:
         raise FileNotFoundError(f"Archivo de datos no encontrado: {PARQUET_PATH}")
 
-    conn = duckdb.connect(':memory:')
-    conn.execute(f"""
-        CREATE TABLE {DATA_TABLE} AS
-        SELECT * FROM read_parquet('{PARQUET_PATH}')
-    """)
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        for tabla in [*TERRITORY_TABLES.values(), TERRITORIES_TABLE, LOAD_INFO_TABLE]:
+            conn.execute(f"DROP TABLE IF EXISTS {tabla}")
+        for col in ENUM_COLUMNS:
+            conn.execute(f"DROP TYPE IF EXISTS {col}_enum")
+
+        # Labels become small integer codes: equality filters and GROUP BYs
+        # on them no longer compare strings row by row.
+        for col in ENUM_COLUMNS:
+            conn.execute(f"""
+                CREATE TYPE {col}_enum AS ENUM (
+                    SELECT DISTINCT {col} FROM read_parquet('{PARQUET_PATH}')
+                    WHERE {col} IS NOT NULL
+                )
+            """)
+
+        select_list = _lista_carga()
+
+        # One table per tipo_territorio, physically clustered by territory and
+        # recommendation. DuckDB keeps min/max zonemaps per row group, so filters
+        # on these columns skip whole row groups and GROUP BYs scan contiguous
+        # runs; no indexes are needed.
+        for tipo, tabla in TERRITORY_TABLES.items():
+            conn.execute(f"""
+                CREATE TABLE {tabla} AS
+                SELECT {select_list} FROM read_parquet('{PARQUET_PATH}')
+                WHERE tipo_territorio = ?
+                ORDER BY dpto_cdpmp, mpio_cdpmp, recommendation_code
+            """, [tipo])
+
+        # Territory dimension (~1.1k rows): dropdown lookups read this instead
+        # of running DISTINCT over the full fact tables.
+        conn.execute(f"""
+            CREATE TABLE {TERRITORIES_TABLE} AS
+            SELECT DISTINCT tipo_territorio, dpto_cdpmp, dpto, mpio_cdpmp, mpio
+            FROM {MUNICIPAL_TABLE}
+            UNION
+            SELECT DISTINCT tipo_territorio, dpto_cdpmp, dpto, mpio_cdpmp, mpio
+            FROM {DEPARTMENTAL_TABLE}
+        """)
+
+        conn.execute(
+            f"""
+            CREATE TABLE {LOAD_INFO_TABLE} AS
+            SELECT ?::VARCHAR AS esquema, ?::BIGINT AS tamano, ?::BIGINT AS mtime_ns
+            """,
+            [_firma_esquema(), *firma]
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _limpiar_temporales():
+    """Remove stale temporary builds of DUCKDB_PATH left by killed processes."""
+    limite = time.time() - DUCKDB_TMP_MAX_AGE
+    for ruta in glob.glob(f"{glob.escape(DUCKDB_PATH)}.*.tmp*"):
+        try:
+            if os.path.getmtime(ruta) < limite:
+                os.remove(ruta)
+        except FileNotFoundError:
+            pass
+
+
+def _construir_persistente(config: Dict[str, Any]):
+    """
+    Build the tables into a uniquely named temporary file and move it over
+    DUCKDB_PATH. DuckDB fails instead of waiting when another process has
+    the file open, so DUCKDB_PATH itself is never opened for writing.
+    The name is a uuid, not the PID: containers sharing the file on a
+    volume all run the app as PID 1.
+    """
+    _limpiar_temporales()
+    temporal = f"{DUCKDB_PATH}.{uuid.uuid4().hex}.tmp"
+    restos = [temporal, f"{temporal}.wal"]
+    try:
+        with duckdb.connect(temporal, config=config) as conn:
+            _cargar_tablas(conn)
+            conn.execute("CHECKPOINT")
+        os.replace(temporal, DUCKDB_PATH)
+    finally:
+        for ruta in restos:
+            if os.path.exists(ruta):
+                os.remove(ruta)
+
+
+def _conectar_persistente(config: Dict[str, Any]) -> duckdb.DuckDBPyConnection:
+    """
+    Open DUCKDB_PATH read-only, building or rebuilding it first if needed.
+    Processes starting together may each build a copy; the last os.replace
+    wins and every copy holds the same tables.
+    """
+    for intento in range(DUCKDB_OPEN_RETRIES):
+        try:
+            if os.path.exists(DUCKDB_PATH):
+                conn = duckdb.connect(DUCKDB_PATH, read_only=True, config=config)
+                if _tablas_vigentes(conn):
+                    return conn
+                conn.close()
+
+            _construir_persistente(config)
+            return duckdb.connect(DUCKDB_PATH, read_only=True, config=config)
+        except duckdb.IOException:
+            if intento == DUCKDB_OPEN_RETRIES - 1:
+                raise
+            time.sleep(0.5 * 2 ** intento)
+
+
+@st.cache_resource
+def _init_db():
+    """
+    One-time load of parquet into DuckDB tables.
+    In memory by default; with DUCKDB_PATH set, the tables are kept in
+    that file and later processes open it read-only without re-reading the
+    parquet, unless the parquet or the load schema has changed since they
+    were built.
+    Cached for the lifetime of the app process.
+    Returns (connection, lock); the lock guards cursor creation.
+    """
+    config = {}
+    if DUCKDB_THREADS:
+        config['threads'] = DUCKDB_THREADS
+    if DUCKDB_MEMORY_LIMIT:
+        config['memory_limit'] = DUCKDB_MEMORY_LIMIT
+
+    if DUCKDB_PATH:
+        conn = _conectar_persistente(config)
+    else:
+        conn = duckdb.connect(':memory:', config=config)
+        _cargar_tablas(conn)
+
+    # Set only after the ordered load above. From here on every query that
+    # cares about order has its own ORDER BY, so parallel operators may
+    # emit rows in any order instead of merging back to insertion order.
+    conn.execute("SET preserve_insertion_order = false")
     lock = threading.Lock()
     return conn, lock
 
 
-def _execute_query(query: str) -> list:
+def _cursor() -> duckdb.DuckDBPyConnection:
     """
-    Execute a query on the shared in-memory database.
-    Thread-safe via lock. Returns raw results as a list of tuples.
+    Open a cursor on the shared database.
+    Cursors share the loaded tables but execute independently, so queries
+    from concurrent sessions run in parallel instead of queueing on one
+    connection. Only the cursor creation touches the parent, under the lock.
     """
     conn, lock = _init_db()
     with lock:
-        return conn.execute(query).fetchall()
+        return conn.cursor()
 
 
-def _execute_query_df(query: str) -> pd.DataFrame:
+def _execute_query(query: str, params: list = None) -> list:
     """
-    Execute a query on the shared in-memory database.
-    Thread-safe via lock. Returns results as a DataFrame.
+    Execute a query on the shared database.
+    Values are bound to `?` placeholders, never interpolated into the SQL.
+    Runs on its own cursor. Returns raw results as a list of tuples.
     """
-    conn, lock = _init_db()
-    with lock:
-        return conn.execute(query).df()
+    cursor = _cursor()
+    try:
+        return cursor.execute(query, params or []).fetchall()
+    finally:
+        cursor.close()
+
+
+def _execute_query_arrow(query: str, params: list = None) -> pa.Table:
+    """
+    Execute a query on the shared database.
+    Values are bound to `?` placeholders, never interpolated into the SQL.
+    Runs on its own cursor. Returns results as an Arrow table (no copy for
+    numeric columns, ENUMs arrive dictionary-encoded).
+    """
+    cursor = _cursor()
+    try:
+        return cursor.execute(query, params or []).fetch_arrow_table()
+    finally:
+        cursor.close()
+
+
+def _execute_query_df(query: str, params: list = None) -> pd.DataFrame:
+    """
+    Execute a query and return results as a DataFrame.
+    Goes through Arrow, which is markedly faster than .df() on the wide text
+    results; the pandas conversion releases Arrow buffers as it goes.
+    """
+    table = _execute_query_arrow(query, params)
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def _tabla_territorio(tipo_territorio: str) -> str:
+    """
+    Resolve the table holding rows for a tipo_territorio.
+    Raises ValueError for unknown types instead of building SQL from them.
+    """
+    if tipo_territorio not in TERRITORY_TABLES:
+        raise ValueError(f"Tipo de territorio no válido: {tipo_territorio}")
+    return TERRITORY_TABLES[tipo_territorio]
 
 
 def construir_filtros_where(filtro_pdet: str = "Todos",
                             filtro_iica: list = None,
                             filtro_ipm: tuple = (0.0, 100.0),
-                            filtro_mdm: list = None) -> str:
+                            filtro_mdm: list = None) -> Tuple[str, tuple]:
     """
     Construye cláusula WHERE para filtros socioeconómicos.
 
     Args:
         filtro_pdet: Filtro PDET ("Todos", "Solo PDET", "Solo No PDET")
-        filtro_iica: Lista categorías IICA
+        filtro_iica: Lista o tupla de categorías IICA
         filtro_ipm: Rango IPM (min, max)
-        filtro_mdm: Lista grupos MDM
+        filtro_mdm: Lista o tupla de grupos MDM
 
     Returns:
-        String con condiciones WHERE adicionales
+        Tuple (condiciones WHERE adicionales con `?`, parámetros en orden)
+
+    Callers pass their filter arguments straight through; normalization to
+    hashable tuples happens here once, ahead of the memoized builder.
+    """
+    return _construir_filtros_where(
+        filtro_pdet,
+        tuple(filtro_iica) if filtro_iica else (),
+        tuple(filtro_ipm) if filtro_ipm else (0.0, 100.0),
+        tuple(filtro_mdm) if filtro_mdm else ()
+    )
+
+
+@lru_cache(maxsize=256)
+def _construir_filtros_where(filtro_pdet: str,
+                             filtro_iica: tuple,
+                             filtro_ipm: tuple,
+                             filtro_mdm: tuple) -> Tuple[str, tuple]:
+    """
+    Memoized body of construir_filtros_where, keyed on hashable filter tuples.
+    Reruns with the same sidebar filters reuse the fragment already built.
+    IN-lists are bound as a single list parameter, so the SQL text does not
+    depend on how many categories are selected. The list is cast to the
+    column's ENUM once; unknown labels become NULL and match nothing.
     """
+    if filtro_pdet not in FILTROS_PDET:
+        raise ValueError(f"Filtro PDET no válido: {filtro_pdet}")
+
     conditions = []
+    params = []
 
-    if filtro_pdet == "Solo PDET":
-        conditions.append("PDET = 1")
-    elif filtro_pdet == "Solo No PDET":
-        conditions.append("PDET = 0")
+    if FILTROS_PDET[filtro_pdet]:
+        conditions.append(FILTROS_PDET[filtro_pdet])
 
-    if filtro_iica and len(filtro_iica) > 0:
-        iica_escaped = [x.replace("'", "''") for x in filtro_iica]
-        iica_list = "','".join(iica_escaped)
-        conditions.append(f"Cat_IICA IN ('{iica_list}')")
+    if filtro_iica:
+        conditions.append("list_contains(TRY_CAST(? AS Cat_IICA_enum[]), Cat_IICA)")
+        params.append(filtro_iica)
 
-    if filtro_ipm and filtro_ipm != (0.0, 100.0):
-        conditions.append(f"IPM_2018 BETWEEN {filtro_ipm[0]} AND {filtro_ipm[1]}")
+    if filtro_ipm != (0.0, 100.0):
+        conditions.append("IPM_2018 BETWEEN ? AND ?")
+        params.extend(filtro_ipm[:2])
 
-    if filtro_mdm and len(filtro_mdm) > 0:
-        mdm_escaped = [x.replace("'", "''") for x in filtro_mdm]
-        mdm_list = "','".join(mdm_escaped)
-        conditions.append(f"Grupo_MDM IN ('{mdm_list}')")
+    if filtro_mdm:
+        conditions.append("list_contains(TRY_CAST(? AS Grupo_MDM_enum[]), Grupo_MDM)")
+        params.append(filtro_mdm)
 
-    return " AND " + " AND ".join(conditions) if conditions else ""
+    clause = " AND " + " AND ".join(conditions) if conditions else ""
+    return clause, tuple(params)
 
 
 @st.cache_data
@@ -124,8 +467,7 @@ def obtener_metadatos_basicos() -> Dict[str, Any]:
                 COUNT(DISTINCT mpio_cdpmp) as total_municipios,
                 COUNT(DISTINCT recommendation_code) as total_recomendaciones,
                 AVG(sentence_similarity) as similitud_promedio
-            FROM {DATA_TABLE}
-            WHERE tipo_territorio = 'Municipio'
+            FROM {MUNICIPAL_TABLE}
         """)
 
         if resultado:
@@ -144,7 +486,7 @@ def obtener_metadatos_basicos() -> Dict[str, Any]:
         return {}
 
 
-@st.cache_data(ttl=300)
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
 def obtener_metadatos_filtrados(umbral_similitud: float,
                                 filtro_pdet: str = "Todos",
                                 filtro_iica: tuple = (),
@@ -162,8 +504,8 @@ def obtener_metadatos_filtrados(umbral_similitud: float,
         Diccionario con estadísticas filtradas
     """
     try:
-        filtros_adicionales = construir_filtros_where(
-            filtro_pdet, list(filtro_iica) or None, (0.0, 100.0), list(filtro_mdm) or None
+        filtros_adicionales, filtros_params = construir_filtros_where(
+            filtro_pdet, filtro_iica, (0.0, 100.0), filtro_mdm
         )
 
         resultado = _execute_query(f"""
@@ -173,11 +515,10 @@ def obtener_metadatos_filtrados(umbral_similitud: float,
                 COUNT(DISTINCT mpio_cdpmp) as total_municipios,
                 COUNT(DISTINCT recommendation_code) as total_recomendaciones,
                 AVG(sentence_similarity) as similitud_promedio
-            FROM {DATA_TABLE}
-            WHERE sentence_similarity >= {umbral_similitud}
-            AND tipo_territorio = 'Municipio'
+            FROM {MUNICIPAL_TABLE}
+            WHERE sentence_similarity >= ?
             {filtros_adicionales}
-        """)
+        """, [umbral_similitud, *filtros_params])
 
         if resultado:
             row = resultado[0]
@@ -195,7 +536,7 @@ def obtener_metadatos_filtrados(umbral_similitud: float,
         return {}
 
 
-@st.cache_data(ttl=300)
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES_ROWS)
 def consultar_datos_filtrados(umbral_similitud: float,
                               departamento: str = None,
                               municipio: str = None,
@@ -227,57 +568,174 @@ def consultar_datos_filtrados(umbral_similitud: float,
         DataFrame con datos filtrados
     """
     try:
+        tabla = _tabla_territorio(tipo_territorio)
         cols = list(columns) if columns else DEFAULT_COLUMNS
+        desconocidas = [col for col in cols if col not in COLUMNS_USED]
+        if desconocidas:
+            raise ValueError(f"Columnas no disponibles: {desconocidas}")
         col_list = ", ".join(cols)
 
         where_conditions = [
-            f"sentence_similarity >= {umbral_similitud}",
-            f"tipo_territorio = '{tipo_territorio}'"
+            "sentence_similarity >= ?"
         ]
+        params = [umbral_similitud]
 
         if solo_politica_publica:
-            where_conditions.append("predicted_class = 'Incluida'")
+            where_conditions.append("predicted_class = TRY_CAST('Incluida' AS predicted_class_enum)")
         else:
-            where_conditions.append("predicted_class = 'Excluida'")
+            where_conditions.append("predicted_class = TRY_CAST('Excluida' AS predicted_class_enum)")
 
         if departamento and departamento != 'Todos':
-            departamento_escaped = departamento.replace("'", "''")
-            where_conditions.append(f"dpto = '{departamento_escaped}'")
+            where_conditions.append("dpto = ?")
+            params.append(departamento)
 
         if municipio and municipio != 'Todos':
-            municipio_escaped = municipio.replace("'", "''")
-            where_conditions.append(f"mpio = '{municipio_escaped}'")
+            where_conditions.append("mpio = ?")
+            params.append(municipio)
 
         # Add socioeconomic filters only for municipalities
-        filtro_iica_list = list(filtro_iica) if filtro_iica else None
-        filtro_ipm_tuple = tuple(filtro_ipm) if filtro_ipm else (0.0, 100.0)
-        filtro_mdm_list = list(filtro_mdm) if filtro_mdm else None
-
         if tipo_territorio == 'Municipio':
-            filtros_adicionales = construir_filtros_where(
-                filtro_pdet, filtro_iica_list, filtro_ipm_tuple, filtro_mdm_list
+            filtros_adicionales, filtros_params = construir_filtros_where(
+                filtro_pdet, filtro_iica, filtro_ipm, filtro_mdm
             )
+            params.extend(filtros_params)
         else:
             filtros_adicionales = ""
 
         where_clause = " AND ".join(where_conditions) + filtros_adicionales
-        limit_clause = f"LIMIT {limite}" if limite else ""
+        limit_clause = ""
+        if limite:
+            limit_clause = "LIMIT ?"
+            params.append(limite)
 
         query = f"""
-            SELECT {col_list} FROM {DATA_TABLE}
+            SELECT {col_list} FROM {tabla}
             WHERE {where_clause}
             ORDER BY sentence_similarity DESC
             {limit_clause}
         """
 
-        return _execute_query_df(query)
+        return _execute_query_df(query, params)
 
     except Exception as e:
         st.error(f"Error en consulta filtrada: {str(e)}")
         return pd.DataFrame()
 
 
-@st.cache_data(ttl=300)
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+def obtener_resumen_comparativo(umbral_similitud: float,
+                                departamento: str = None,
+                                solo_politica_publica: bool = True,
+                                tipo_territorio: str = 'Municipio') -> Dict[str, Any]:
+    """
+    Métricas resumen de la vista comparativa calculadas en DuckDB,
+    sin traer las oraciones filtradas a pandas.
+
+    Args:
+        umbral_similitud: Similitud mínima requerida
+        departamento: Nombre del departamento (opcional)
+        solo_politica_publica: Filtrar solo política pública
+        tipo_territorio: 'Municipio' o 'Departamento'
+
+    Returns:
+        Diccionario con conteos distintos y similitud promedio
+    """
+    try:
+        tabla = _tabla_territorio(tipo_territorio)
+        where_conditions = [
+            "sentence_similarity >= ?"
+        ]
+        params = [umbral_similitud]
+
+        if solo_politica_publica:
+            where_conditions.append("predicted_class = TRY_CAST('Incluida' AS predicted_class_enum)")
+        else:
+            where_conditions.append("predicted_class = TRY_CAST('Excluida' AS predicted_class_enum)")
+
+        if departamento and departamento != 'Todos':
+            where_conditions.append("dpto = ?")
+            params.append(departamento)
+
+        where_clause = " AND ".join(where_conditions)
+
+        resultado = _execute_query(f"""
+            SELECT
+                COUNT(*) as total_registros,
+                COUNT(DISTINCT dpto) as total_departamentos,
+                COUNT(DISTINCT mpio_cdpmp) as total_municipios,
+                COUNT(DISTINCT recommendation_code) as total_recomendaciones,
+                AVG(sentence_similarity) as similitud_promedio
+            FROM {tabla}
+            WHERE {where_clause}
+        """, params)
+
+        if resultado:
+            row = resultado[0]
+            return {
+                'total_registros': row[0],
+                'total_departamentos': row[1],
+                'total_municipios': row[2],
+                'total_recomendaciones': row[3],
+                'similitud_promedio': row[4]
+            }
+        return {}
+
+    except Exception as e:
+        st.error(f"Error obteniendo resumen comparativo: {str(e)}")
+        return {}
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+def obtener_estadisticas_municipales(umbral_similitud: float,
+                                     filtro_pdet: str = "Todos",
+                                     filtro_iica: tuple = (),
+                                     filtro_ipm: tuple = (0.0, 100.0),
+                                     filtro_mdm: tuple = ()) -> pd.DataFrame:
+    """
+    Recomendaciones distintas y similitud promedio por municipio.
+    Base común de las estadísticas departamentales y del mapa municipal:
+    un solo escaneo de la tabla sirve a ambos.
+
+    Returns:
+        DataFrame con dpto_cdpmp, dpto, mpio_cdpmp, mpio,
+        num_recomendaciones y similitud_promedio
+    """
+    try:
+        filtros_adicionales, filtros_params = construir_filtros_where(
+            filtro_pdet, filtro_iica, filtro_ipm, filtro_mdm
+        )
+        params = [umbral_similitud, *filtros_params]
+
+        query = f"""
+            SELECT
+                dpto_cdpmp,
+                dpto,
+                mpio_cdpmp,
+                mpio,
+                COUNT(DISTINCT recommendation_code) as num_recomendaciones,
+                AVG(sentence_similarity) as similitud_promedio
+            FROM {MUNICIPAL_TABLE}
+            WHERE sentence_similarity >= ?
+            {filtros_adicionales}
+            GROUP BY dpto_cdpmp, dpto, mpio_cdpmp, mpio
+        """
+
+        return _execute_query_df(query, params)
+
+    except Exception as e:
+        st.error(f"Error en estadísticas municipales: {str(e)}")
+        return pd.DataFrame()
+
+
+# Output columns of obtener_estadisticas_departamentales, also used for the
+# empty result so callers can index them without checking.
+DEPARTMENTAL_STATS_COLUMNS = [
+    'dpto_cdpmp', 'Departamento', 'Municipios', 'Promedio_Recomendaciones',
+    'Min_Recomendaciones', 'Municipio_Min', 'Max_Recomendaciones', 'Municipio_Max'
+]
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
 def obtener_estadisticas_departamentales(umbral_similitud: float,
                                          filtro_pdet: str = "Todos",
                                          filtro_iica: tuple = (),
@@ -286,88 +744,46 @@ def obtener_estadisticas_departamentales(umbral_similitud: float,
     """
     Calcula estadísticas agregadas por departamento.
     Incluye min/max por municipio dentro de cada departamento.
+    Agrega en pandas el resultado (~1.1k filas) de
+    obtener_estadisticas_municipales en vez de volver a escanear la tabla.
 
     Returns:
         DataFrame con estadísticas departamentales
     """
     try:
-        filtro_iica_list = list(filtro_iica) if filtro_iica else None
-        filtro_ipm_tuple = tuple(filtro_ipm) if filtro_ipm else (0.0, 100.0)
-        filtro_mdm_list = list(filtro_mdm) if filtro_mdm else None
-
-        filtros_adicionales = construir_filtros_where(
-            filtro_pdet, filtro_iica_list, filtro_ipm_tuple, filtro_mdm_list
+        municipios = obtener_estadisticas_municipales(
+            umbral_similitud, filtro_pdet, filtro_iica, filtro_ipm, filtro_mdm
         )
-
-        query = f"""
-            WITH recomendaciones_por_municipio AS (
-                SELECT
-                    dpto_cdpmp,
-                    dpto,
-                    mpio_cdpmp,
-                    mpio,
-                    COUNT(DISTINCT recommendation_code) as num_recomendaciones
-                FROM {DATA_TABLE}
-                WHERE tipo_territorio = 'Municipio'
-                AND sentence_similarity >= {umbral_similitud}
-                {filtros_adicionales}
-                GROUP BY dpto_cdpmp, dpto, mpio_cdpmp, mpio
-            ),
-            ranking_por_depto AS (
-                SELECT
-                    *,
-                    ROW_NUMBER() OVER (PARTITION BY dpto_cdpmp ORDER BY num_recomendaciones ASC) as rank_min,
-                    ROW_NUMBER() OVER (PARTITION BY dpto_cdpmp ORDER BY num_recomendaciones DESC) as rank_max
-                FROM recomendaciones_por_municipio
-            ),
-            municipio_min AS (
-                SELECT
-                    dpto_cdpmp,
-                    mpio as Municipio_Min,
-                    num_recomendaciones as Min_Recomendaciones
-                FROM ranking_por_depto
-                WHERE rank_min = 1
-            ),
-            municipio_max AS (
-                SELECT
-                    dpto_cdpmp,
-                    mpio as Municipio_Max,
-                    num_recomendaciones as Max_Recomendaciones
-                FROM ranking_por_depto
-                WHERE rank_max = 1
-            ),
-            stats_generales AS (
-                SELECT
-                    dpto_cdpmp,
-                    dpto as Departamento,
-                    COUNT(DISTINCT mpio_cdpmp) as Municipios,
-                    ROUND(AVG(num_recomendaciones), 0) as Promedio_Recomendaciones
-                FROM recomendaciones_por_municipio
-                GROUP BY dpto_cdpmp, dpto
-            )
-            SELECT
-                s.dpto_cdpmp,
-                s.Departamento,
-                s.Municipios,
-                s.Promedio_Recomendaciones,
-                COALESCE(mn.Min_Recomendaciones, 0) as Min_Recomendaciones,
-                COALESCE(mn.Municipio_Min, 'N/A') as Municipio_Min,
-                COALESCE(mx.Max_Recomendaciones, 0) as Max_Recomendaciones,
-                COALESCE(mx.Municipio_Max, 'N/A') as Municipio_Max
-            FROM stats_generales s
-            LEFT JOIN municipio_min mn ON s.dpto_cdpmp = mn.dpto_cdpmp
-            LEFT JOIN municipio_max mx ON s.dpto_cdpmp = mx.dpto_cdpmp
-            ORDER BY s.Promedio_Recomendaciones DESC
-        """
-
-        return _execute_query_df(query)
+        if municipios.empty:
+            return pd.DataFrame(columns=DEPARTMENTAL_STATS_COLUMNS)
+
+        grupos = municipios.groupby(['dpto_cdpmp', 'dpto'], dropna=False)
+        stats = grupos.agg(
+            Municipios=('mpio_cdpmp', 'nunique'),
+            Promedio_Recomendaciones=('num_recomendaciones', 'mean'),
+            Min_Recomendaciones=('num_recomendaciones', 'min'),
+            Max_Recomendaciones=('num_recomendaciones', 'max')
+        )
+        stats['Municipio_Min'] = municipios.loc[
+            grupos['num_recomendaciones'].idxmin(), 'mpio'
+        ].to_numpy()
+        stats['Municipio_Max'] = municipios.loc[
+            grupos['num_recomendaciones'].idxmax(), 'mpio'
+        ].to_numpy()
+        # Half-up rounding, as SQL ROUND did (pandas rounds half to even)
+        stats['Promedio_Recomendaciones'] = (stats['Promedio_Recomendaciones'] + 0.5) // 1
+
+        stats = stats.reset_index().rename(columns={'dpto': 'Departamento'})
+        return stats[DEPARTMENTAL_STATS_COLUMNS].sort_values(
+            'Promedio_Recomendaciones', ascending=False
+        ).reset_index(drop=True)
 
     except Exception as e:
         st.error(f"Error en estadísticas departamentales: {str(e)}")
-        return pd.DataFrame()
+        return pd.DataFrame(columns=DEPARTMENTAL_STATS_COLUMNS)
 
 
-@st.cache_data(ttl=300)
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
 def obtener_ranking_municipios(umbral_similitud: float,
                                solo_politica_publica: bool = True,
                                top_n: int = None,
@@ -383,50 +799,71 @@ def obtener_ranking_municipios(umbral_similitud: float,
     """
     try:
         where_conditions = [
-            f"sentence_similarity >= {umbral_similitud}",
-            "tipo_territorio = 'Municipio'"
+            "sentence_similarity >= ?"
         ]
+        params = [umbral_similitud]
 
         if solo_politica_publica:
-            where_conditions.append("predicted_class = 'Incluida'")
+            where_conditions.append("predicted_class = TRY_CAST('Incluida' AS predicted_class_enum)")
         else:
-            where_conditions.append("predicted_class = 'Excluida'")
+            where_conditions.append("predicted_class = TRY_CAST('Excluida' AS predicted_class_enum)")
 
-        filtro_iica_list = list(filtro_iica) if filtro_iica else None
-        filtro_ipm_tuple = tuple(filtro_ipm) if filtro_ipm else (0.0, 100.0)
-        filtro_mdm_list = list(filtro_mdm) if filtro_mdm else None
-
-        filtros_adicionales = construir_filtros_where(
-            filtro_pdet, filtro_iica_list, filtro_ipm_tuple, filtro_mdm_list
+        filtros_adicionales, filtros_params = construir_filtros_where(
+            filtro_pdet, filtro_iica, filtro_ipm, filtro_mdm
         )
+        params.extend(filtros_params)
         where_clause = " AND ".join(where_conditions) + filtros_adicionales
-        limit_clause = f"LIMIT {top_n}" if top_n else ""
-
+        limit_clause = ""
+        if top_n:
+            limit_clause = "LIMIT ?"
+            params.append(top_n)
+
+        # Pre-group by (municipio, recomendación) so the distinct count
+        # becomes a plain COUNT(*) over the narrow intermediate. Ranking is
+        # numbered after the LIMIT, so a top_n request only sorts its slice.
         query = f"""
+            WITH por_recomendacion AS (
+                SELECT
+                    mpio_cdpmp,
+                    mpio,
+                    dpto,
+                    recommendation_code,
+                    COUNT(*) as oraciones,
+                    SUM(sentence_similarity) as suma_similitud,
+                    COUNT_IF(recommendation_priority = 1) as oraciones_prioritarias
+                FROM {MUNICIPAL_TABLE}
+                WHERE {where_clause}
+                GROUP BY mpio_cdpmp, mpio, dpto, recommendation_code
+            ),
+            por_municipio AS (
+                SELECT
+                    mpio_cdpmp,
+                    mpio as Municipio,
+                    dpto as Departamento,
+                    COUNT(*) as Recomendaciones_Implementadas,
+                    SUM(oraciones)::BIGINT as Total_Oraciones,
+                    SUM(suma_similitud) / SUM(oraciones) as Similitud_Promedio,
+                    SUM(oraciones_prioritarias)::BIGINT as Prioritarias_Implementadas
+                FROM por_recomendacion
+                GROUP BY mpio_cdpmp, mpio, dpto
+                ORDER BY Recomendaciones_Implementadas DESC
+                {limit_clause}
+            )
             SELECT
-                mpio_cdpmp,
-                mpio as Municipio,
-                dpto as Departamento,
-                COUNT(DISTINCT recommendation_code) as Recomendaciones_Implementadas,
-                COUNT(*) as Total_Oraciones,
-                AVG(sentence_similarity) as Similitud_Promedio,
-                COUNT(CASE WHEN recommendation_priority = 1 THEN 1 END) as Prioritarias_Implementadas,
-                ROW_NUMBER() OVER (ORDER BY COUNT(DISTINCT recommendation_code) DESC) as Ranking
-            FROM {DATA_TABLE}
-            WHERE {where_clause}
-            GROUP BY mpio_cdpmp, mpio, dpto
-            ORDER BY Recomendaciones_Implementadas DESC
-            {limit_clause}
+                *,
+                ROW_NUMBER() OVER (ORDER BY Recomendaciones_Implementadas DESC) as Ranking
+            FROM por_municipio
+            ORDER BY Ranking
         """
 
-        return _execute_query_df(query)
+        return _execute_query_df(query, params)
 
     except Exception as e:
         st.error(f"Error generando ranking: {str(e)}")
         return pd.DataFrame()
 
 
-@st.cache_data(ttl=300)
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
 def obtener_ranking_municipio_especifico(municipio: str,
                                           umbral_similitud: float,
                                           solo_politica_publica: bool = True,
@@ -442,43 +879,38 @@ def obtener_ranking_municipio_especifico(municipio: str,
     """
     try:
         where_conditions = [
-            f"sentence_similarity >= {umbral_similitud}",
-            "tipo_territorio = 'Municipio'"
+            "sentence_similarity >= ?"
         ]
+        params = [umbral_similitud]
 
         if solo_politica_publica:
-            where_conditions.append("predicted_class = 'Incluida'")
+            where_conditions.append("predicted_class = TRY_CAST('Incluida' AS predicted_class_enum)")
         else:
-            where_conditions.append("predicted_class = 'Excluida'")
+            where_conditions.append("predicted_class = TRY_CAST('Excluida' AS predicted_class_enum)")
 
-        filtro_iica_list = list(filtro_iica) if filtro_iica else None
-        filtro_ipm_tuple = tuple(filtro_ipm) if filtro_ipm else (0.0, 100.0)
-        filtro_mdm_list = list(filtro_mdm) if filtro_mdm else None
-
-        filtros_adicionales = construir_filtros_where(
-            filtro_pdet, filtro_iica_list, filtro_ipm_tuple, filtro_mdm_list
+        filtros_adicionales, filtros_params = construir_filtros_where(
+            filtro_pdet, filtro_iica, filtro_ipm, filtro_mdm
         )
+        params.extend(filtros_params)
         where_clause = " AND ".join(where_conditions) + filtros_adicionales
 
-        municipio_escaped = municipio.replace("'", "''")
-
         query = f"""
             WITH ranking AS (
                 SELECT
                     mpio,
                     COUNT(DISTINCT recommendation_code) as num_recs,
                     ROW_NUMBER() OVER (ORDER BY COUNT(DISTINCT recommendation_code) DESC) as rank_pos
-                FROM {DATA_TABLE}
+                FROM {MUNICIPAL_TABLE}
                 WHERE {where_clause}
                 GROUP BY mpio
             )
             SELECT
-                (SELECT rank_pos FROM ranking WHERE mpio = '{municipio_escaped}') as ranking_position,
+                (SELECT rank_pos FROM ranking WHERE mpio = ?) as ranking_position,
                 COUNT(*) as total_municipios
             FROM ranking
         """
 
-        resultado = _execute_query(query)
+        resultado = _execute_query(query, [*params, municipio])
         if resultado:
             row = resultado[0]
             return {
@@ -492,7 +924,7 @@ def obtener_ranking_municipio_especifico(municipio: str,
         return {'ranking_position': "N/A", 'total_municipios': 0}
 
 
-@st.cache_data(ttl=300)
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
 def obtener_ranking_departamento_especifico(departamento: str,
                                              umbral_similitud: float,
                                              solo_politica_publica: bool = True) -> Dict[str, Any]:
@@ -504,17 +936,16 @@ def obtener_ranking_departamento_especifico(departamento: str,
     """
     try:
         where_conditions = [
-            f"sentence_similarity >= {umbral_similitud}",
-            "tipo_territorio = 'Departamento'"
+            "sentence_similarity >= ?"
         ]
+        params = [umbral_similitud]
 
         if solo_politica_publica:
-            where_conditions.append("predicted_class = 'Incluida'")
+            where_conditions.append("predicted_class = TRY_CAST('Incluida' AS predicted_class_enum)")
         else:
-            where_conditions.append("predicted_class = 'Excluida'")
+            where_conditions.append("predicted_class = TRY_CAST('Excluida' AS predicted_class_enum)")
 
         where_clause = " AND ".join(where_conditions)
-        departamento_escaped = departamento.replace("'", "''")
 
         query = f"""
             WITH ranking AS (
@@ -522,17 +953,17 @@ def obtener_ranking_departamento_especifico(departamento: str,
                     dpto,
                     COUNT(DISTINCT recommendation_code) as num_recs,
                     ROW_NUMBER() OVER (ORDER BY COUNT(DISTINCT recommendation_code) DESC) as rank_pos
-                FROM {DATA_TABLE}
+                FROM {DEPARTMENTAL_TABLE}
                 WHERE {where_clause}
                 GROUP BY dpto
             )
             SELECT
-                (SELECT rank_pos FROM ranking WHERE dpto = '{departamento_escaped}') as ranking_position,
+                (SELECT rank_pos FROM ranking WHERE dpto = ?) as ranking_position,
                 COUNT(*) as total_departamentos
             FROM ranking
         """
 
-        resultado = _execute_query(query)
+        resultado = _execute_query(query, [*params, departamento])
         if resultado:
             row = resultado[0]
             return {
@@ -546,7 +977,7 @@ def obtener_ranking_departamento_especifico(departamento: str,
         return {'ranking_position': "N/A", 'total_departamentos': 0}
 
 
-@st.cache_data(ttl=300)
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
 def obtener_top_recomendaciones(umbral_similitud: float = 0.6,
                                 departamento: str = None,
                                 municipio: str = None,
@@ -563,25 +994,22 @@ def obtener_top_recomendaciones(umbral_similitud: float = 0.6,
     """
     try:
         where_conditions = [
-            f"sentence_similarity >= {umbral_similitud}",
-            "tipo_territorio = 'Municipio'"
+            "sentence_similarity >= ?"
         ]
+        params = [umbral_similitud]
 
         if departamento and departamento != 'Todos':
-            departamento_escaped = departamento.replace("'", "''")
-            where_conditions.append(f"dpto = '{departamento_escaped}'")
+            where_conditions.append("dpto = ?")
+            params.append(departamento)
 
         if municipio and municipio != 'Todos':
-            municipio_escaped = municipio.replace("'", "''")
-            where_conditions.append(f"mpio = '{municipio_escaped}'")
+            where_conditions.append("mpio = ?")
+            params.append(municipio)
 
-        filtro_iica_list = list(filtro_iica) if filtro_iica else None
-        filtro_ipm_tuple = tuple(filtro_ipm) if filtro_ipm else (0.0, 100.0)
-        filtro_mdm_list = list(filtro_mdm) if filtro_mdm else None
-
-        filtros_adicionales = construir_filtros_where(
-            filtro_pdet, filtro_iica_list, filtro_ipm_tuple, filtro_mdm_list
+        filtros_adicionales, filtros_params = construir_filtros_where(
+            filtro_pdet, filtro_iica, filtro_ipm, filtro_mdm
         )
+        params.extend(filtros_params)
         where_clause = " AND ".join(where_conditions) + filtros_adicionales
 
         query = f"""
@@ -592,21 +1020,21 @@ def obtener_top_recomendaciones(umbral_similitud: float = 0.6,
                 COUNT(*) as Frecuencia_Oraciones,
                 COUNT(DISTINCT mpio_cdpmp) as Municipios_Implementan,
                 AVG(sentence_similarity) as Similitud_Promedio
-            FROM {DATA_TABLE}
+            FROM {MUNICIPAL_TABLE}
             WHERE {where_clause}
             GROUP BY recommendation_code, recommendation_text, recommendation_priority
             ORDER BY Frecuencia_Oraciones DESC
-            LIMIT {limite}
+            LIMIT ?
         """
 
-        return _execute_query_df(query)
+        return _execute_query_df(query, [*params, limite])
 
     except Exception as e:
         st.error(f"Error obteniendo top recomendaciones: {str(e)}")
         return pd.DataFrame()
 
 
-@st.cache_data(ttl=300)
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
 def obtener_municipios_por_recomendacion(codigo_recomendacion: str,
                                          umbral_similitud: float = 0.6,
                                          limite: int = 100,
@@ -621,14 +1049,10 @@ def obtener_municipios_por_recomendacion(codigo_recomendacion: str,
         DataFrame con municipios ordenados por frecuencia
     """
     try:
-        codigo_escaped = codigo_recomendacion.replace("'", "''")
-        filtro_iica_list = list(filtro_iica) if filtro_iica else None
-        filtro_ipm_tuple = tuple(filtro_ipm) if filtro_ipm else (0.0, 100.0)
-        filtro_mdm_list = list(filtro_mdm) if filtro_mdm else None
-
-        filtros_adicionales = construir_filtros_where(
-            filtro_pdet, filtro_iica_list, filtro_ipm_tuple, filtro_mdm_list
+        filtros_adicionales, filtros_params = construir_filtros_where(
+            filtro_pdet, filtro_iica, filtro_ipm, filtro_mdm
         )
+        params = [codigo_recomendacion, umbral_similitud, *filtros_params, limite]
 
         query = f"""
             SELECT
@@ -637,28 +1061,28 @@ def obtener_municipios_por_recomendacion(codigo_recomendacion: str,
                 COUNT(*) as Frecuencia_Oraciones,
                 AVG(sentence_similarity) as Similitud_Promedio,
                 MAX(sentence_similarity) as Similitud_Maxima
-            FROM {DATA_TABLE}
-            WHERE recommendation_code = '{codigo_escaped}'
-            AND sentence_similarity >= {umbral_similitud}
-            AND tipo_territorio = 'Municipio'
+            FROM {MUNICIPAL_TABLE}
+            WHERE recommendation_code = ?
+            AND sentence_similarity >= ?
             {filtros_adicionales}
             GROUP BY mpio, dpto
             ORDER BY Frecuencia_Oraciones DESC, Similitud_Promedio DESC
-            LIMIT {limite}
+            LIMIT ?
         """
 
-        return _execute_query_df(query)
+        return _execute_query_df(query, params)
 
     except Exception as e:
         st.error(f"Error obteniendo municipios por recomendación: {str(e)}")
         return pd.DataFrame()
 
 
-@st.cache_data
+@st.cache_resource
 def obtener_todos_los_municipios() -> pd.DataFrame:
     """
     Obtiene lista completa de municipios únicos disponibles.
-    Cached permanently: underlying data does not change.
+    Built once per process and shared by all sessions without a per-rerun
+    copy; callers must treat it as read-only.
 
     Returns:
         DataFrame con código, nombre de municipio y departamento
@@ -670,8 +1094,8 @@ def obtener_todos_los_municipios() -> pd.DataFrame:
                 mpio as Municipio,
                 dpto_cdpmp,
                 dpto as Departamento
-            FROM {DATA_TABLE}
-            WHERE tipo_territorio = 'Municipio'
+            FROM {TERRITORIES_TABLE}
+            WHERE tipo_territorio = TRY_CAST('Municipio' AS tipo_territorio_enum)
             ORDER BY dpto, mpio
         """
 
@@ -682,37 +1106,68 @@ def obtener_todos_los_municipios() -> pd.DataFrame:
         return pd.DataFrame()
 
 
-@st.cache_data
+@st.cache_resource
 def obtener_todos_los_departamentos() -> pd.DataFrame:
     """
     Obtiene lista completa de departamentos únicos disponibles.
-    Cached permanently: underlying data does not change.
+    Built once per process and shared by all sessions without a per-rerun
+    copy; callers must treat it as read-only.
+    Derived from obtener_todos_los_municipios, so both dropdowns come from
+    a single query.
 
     Returns:
         DataFrame con código y nombre de departamento
     """
     try:
-        query = f"""
-            SELECT DISTINCT
-                dpto_cdpmp,
-                dpto as Departamento
-            FROM {DATA_TABLE}
-            WHERE tipo_territorio = 'Municipio'
-            ORDER BY dpto
-        """
-
-        return _execute_query_df(query)
+        municipios = obtener_todos_los_municipios()
+        if municipios.empty:
+            return pd.DataFrame()
+
+        return (
+            municipios[['dpto_cdpmp', 'Departamento']]
+            .drop_duplicates()
+            .sort_values('Departamento')
+            .reset_index(drop=True)
+        )
 
     except Exception as e:
         st.error(f"Error obteniendo lista de departamentos: {str(e)}")
         return pd.DataFrame()
 
 
-@st.cache_data
+@st.cache_resource
+def obtener_municipios_por_departamento() -> Dict[str, List[str]]:
+    """
+    Obtiene los municipios de cada departamento, ordenados, para el selector.
+    Built once per process from obtener_todos_los_municipios, so a rerun
+    is a dict lookup instead of a mask over the full frame; callers must
+    treat the lists as read-only.
+
+    Returns:
+        Dict de nombre de departamento a lista de municipios
+    """
+    try:
+        municipios = obtener_todos_los_municipios()
+        if municipios.empty:
+            return {}
+
+        nombres = municipios['Municipio'].to_numpy()
+        return {
+            departamento: sorted(nombres[indices].tolist())
+            for departamento, indices in municipios.groupby('Departamento').indices.items()
+        }
+
+    except Exception as e:
+        st.error(f"Error obteniendo municipios por departamento: {str(e)}")
+        return {}
+
+
+@st.cache_resource
 def obtener_todos_los_departamentos_territorio() -> pd.DataFrame:
     """
     Obtiene lista de departamentos únicos con datos tipo_territorio = 'Departamento'
-    Cached permanently: underlying data does not change.
+    Built once per process and shared by all sessions without a per-rerun
+    copy; callers must treat it as read-only.
 
     Returns:
         DataFrame con departamentos disponibles
@@ -722,8 +1177,8 @@ def obtener_todos_los_departamentos_territorio() -> pd.DataFrame:
             SELECT DISTINCT
                 dpto_cdpmp,
                 dpto as Departamento
-            FROM {DATA_TABLE}
-            WHERE tipo_territorio = 'Departamento'
+            FROM {TERRITORIES_TABLE}
+            WHERE tipo_territorio = TRY_CAST('Departamento' AS tipo_territorio_enum)
             ORDER BY dpto
         """
 
@@ -734,7 +1189,7 @@ def obtener_todos_los_departamentos_territorio() -> pd.DataFrame:
         return pd.DataFrame()
 
 
-@st.cache_data(ttl=300)
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
 def obtener_ranking_departamentos(umbral_similitud: float,
                                   solo_politica_publica: bool = True,
                                   top_n: int = None) -> pd.DataFrame:
@@ -746,45 +1201,57 @@ def obtener_ranking_departamentos(umbral_similitud: float,
     """
     try:
         where_conditions = [
-            f"sentence_similarity >= {umbral_similitud}",
-            "tipo_territorio = 'Departamento'"
+            "sentence_similarity >= ?"
         ]
+        params = [umbral_similitud]
 
         if solo_politica_publica:
-            where_conditions.append("predicted_class = 'Incluida'")
+            where_conditions.append("predicted_class = TRY_CAST('Incluida' AS predicted_class_enum)")
         else:
-            where_conditions.append("predicted_class = 'Excluida'")
+            where_conditions.append("predicted_class = TRY_CAST('Excluida' AS predicted_class_enum)")
 
         where_clause = " AND ".join(where_conditions)
-        limit_clause = f"LIMIT {top_n}" if top_n else ""
+        limit_clause = ""
+        if top_n:
+            limit_clause = "LIMIT ?"
+            params.append(top_n)
 
         query = f"""
+            WITH por_departamento AS (
+                SELECT
+                    dpto_cdpmp,
+                    dpto as Departamento,
+                    COUNT(DISTINCT recommendation_code) as Recomendaciones_Implementadas,
+                    COUNT(*) as Total_Oraciones,
+                    AVG(sentence_similarity) as Similitud_Promedio,
+                    COUNT_IF(recommendation_priority = 1) as Prioritarias_Implementadas
+                FROM {DEPARTMENTAL_TABLE}
+                WHERE {where_clause}
+                GROUP BY dpto_cdpmp, dpto
+                ORDER BY Recomendaciones_Implementadas DESC
+                {limit_clause}
+            )
             SELECT
-                dpto_cdpmp,
-                dpto as Departamento,
-                COUNT(DISTINCT recommendation_code) as Recomendaciones_Implementadas,
-                COUNT(*) as Total_Oraciones,
-                AVG(sentence_similarity) as Similitud_Promedio,
-                COUNT(CASE WHEN recommendation_priority = 1 THEN 1 END) as Prioritarias_Implementadas,
-                ROW_NUMBER() OVER (ORDER BY COUNT(DISTINCT recommendation_code) DESC) as Ranking
-            FROM {DATA_TABLE}
-            WHERE {where_clause}
-            GROUP BY dpto_cdpmp, dpto
-            ORDER BY Recomendaciones_Implementadas DESC
-            {limit_clause}
+                *,
+                ROW_NUMBER() OVER (ORDER BY Recomendaciones_Implementadas DESC) as Ranking
+            FROM por_departamento
+            ORDER BY Ranking
         """
 
-        return _execute_query_df(query)
+        return _execute_query_df(query, params)
 
     except Exception as e:
         st.error(f"Error generando ranking departamental: {str(e)}")
         return pd.DataFrame()
 
 
-@st.cache_data(ttl=300)
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
 def obtener_datos_mapa_municipal(dpto_code: str, min_similarity: float) -> pd.DataFrame:
     """
     Obtiene datos agregados de municipios de un departamento para el mapa.
+    Filtra obtener_estadisticas_municipales con los filtros por defecto,
+    ya en caché si el mapa departamental se mostró con el mismo umbral
+    y sin filtros socioeconómicos.
 
     Args:
         dpto_code: Código del departamento (se normaliza a 2 dígitos)
@@ -796,22 +1263,20 @@ def obtener_datos_mapa_municipal(dpto_code: str, min_similarity: float) -> pd.Da
     try:
         dpto_code_normalized = str(dpto_code).zfill(2)
 
-        query = f"""
-            SELECT
-                mpio_cdpmp,
-                mpio as Municipio,
-                dpto as Departamento,
-                COUNT(DISTINCT recommendation_code) as Num_Recomendaciones,
-                AVG(sentence_similarity) as Similitud_Promedio
-            FROM {DATA_TABLE}
-            WHERE dpto_cdpmp = '{dpto_code_normalized}'
-            AND sentence_similarity >= {min_similarity}
-            AND tipo_territorio = 'Municipio'
-            GROUP BY mpio_cdpmp, mpio, dpto
-            ORDER BY Num_Recomendaciones DESC
-        """
-
-        return _execute_query_df(query)
+        municipios = obtener_estadisticas_municipales(min_similarity)
+        if municipios.empty:
+            return pd.DataFrame()
+
+        municipios = municipios[municipios['dpto_cdpmp'] == dpto_code_normalized]
+        municipios = municipios.rename(columns={
+            'mpio': 'Municipio',
+            'dpto': 'Departamento',
+            'num_recomendaciones': 'Num_Recomendaciones',
+            'similitud_promedio': 'Similitud_Promedio'
+        })
+        return municipios[[
+            'mpio_cdpmp', 'Municipio', 'Departamento', 'Num_Recomendaciones', 'Similitud_Promedio'
+        ]].sort_values('Num_Recomendaciones', ascending=False).reset_index(drop=True)
 
     except Exception as e:
         st.error(f"Error obteniendo datos de mapa municipal: {str(e)}")
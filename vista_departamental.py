@@ -2,7 +2,9 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 from data_client import (
+    DEPARTMENTAL_VIEW_COLUMNS,
     consultar_datos_filtrados,
+    obtener_resumen_comparativo,
     obtener_todos_los_departamentos_territorio,
     obtener_ranking_departamentos,
     obtener_ranking_departamento_especifico
@@ -63,19 +65,25 @@ def render_ficha_departamental():
         help="Filtrar para incluir solo contenido clasificado como política pública"
     )
 
+    # Vista comparativa: solo métricas agregadas, sin traer las oraciones
+    if selected_department == 'Todos':
+        _render_vista_comparativa_departamental(sentence_threshold, include_policy_only)
+        return
+
     # Obtener datos filtrados using data_client (thread-safe + cached)
     datos_filtrados = consultar_datos_filtrados(
         umbral_similitud=sentence_threshold,
-        departamento=selected_department if selected_department != 'Todos' else None,
+        departamento=selected_department,
         solo_politica_publica=include_policy_only,
-        tipo_territorio='Departamento'
+        tipo_territorio='Departamento',
+        columns=DEPARTMENTAL_VIEW_COLUMNS
     )
 
     # SQL already filters by sentence_similarity >= threshold
     high_quality_sentences = datos_filtrados
 
     # Validación para departamento sin datos
-    if selected_department != 'Todos' and high_quality_sentences.empty:
+    if high_quality_sentences.empty:
         st.warning(f"""
         ⚠️ **Sin datos para mostrar**
 
@@ -89,17 +97,13 @@ def render_ficha_departamental():
         """)
         return
 
-    # Renderizar según selección
-    if selected_department != 'Todos':
-        _render_vista_departamento_especifico(
-            selected_department,
-            sentence_threshold,
-            include_policy_only,
-            datos_filtrados,
-            high_quality_sentences
-        )
-    else:
-        _render_vista_comparativa_departamental(sentence_threshold, datos_filtrados)
+    _render_vista_departamento_especifico(
+        selected_department,
+        sentence_threshold,
+        include_policy_only,
+        datos_filtrados,
+        high_quality_sentences
+    )
 
 
 def _render_vista_departamento_especifico(departamento, sentence_threshold,
@@ -152,13 +156,13 @@ def _render_vista_departamento_especifico(departamento, sentence_threshold,
     _render_diccionario_recomendaciones(datos_departamento, departamento)
 
 
-def _render_vista_comparativa_departamental(sentence_threshold, datos_comparativos):
+def _render_vista_comparativa_departamental(sentence_threshold, include_policy_only):
     """
     Renderiza vista comparativa de múltiples departamentos
 
     Args:
         sentence_threshold: Umbral de similitud
-        datos_comparativos: Datos para comparación
+        include_policy_only: Si filtrar solo política pública
     """
 
     st.markdown(f"""
@@ -173,7 +177,14 @@ def _render_vista_comparativa_departamental(sentence_threshold, datos_comparativ
     </div>
     """, unsafe_allow_html=True)
 
-    if datos_comparativos.empty:
+    # Conteos calculados en DuckDB (sin cargar oraciones en pandas)
+    resumen = obtener_resumen_comparativo(
+        umbral_similitud=sentence_threshold,
+        solo_politica_publica=include_policy_only,
+        tipo_territorio='Departamento'
+    )
+
+    if not resumen.get('total_registros'):
         st.warning("No hay datos disponibles con los filtros actuales")
         return
 
@@ -181,12 +192,11 @@ def _render_vista_comparativa_departamental(sentence_threshold, datos_comparativ
     col1, col2, col3 = st.columns(3)
 
     with col1:
-        st.metric("Departamentos", datos_comparativos['dpto'].nunique())
+        st.metric("Departamentos", resumen['total_departamentos'])
     with col2:
-        st.metric("Recomendaciones", datos_comparativos['recommendation_code'].nunique())
+        st.metric("Recomendaciones", resumen['total_recomendaciones'])
     with col3:
-        avg_similarity = datos_comparativos['sentence_similarity'].mean()
-        st.metric("Similitud Promedio", f"{avg_similarity:.3f}")
+        st.metric("Similitud Promedio", f"{resumen['similitud_promedio']:.3f}")
 
     st.info("💡 Seleccione un departamento específico para ver el reporte detallado")
 
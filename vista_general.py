@@ -7,13 +7,17 @@ from data_client import (
     obtener_municipios_por_recomendacion,
     obtener_estadisticas_departamentales,
     obtener_metadatos_filtrados,
-    obtener_datos_mapa_municipal
+    obtener_datos_mapa_municipal,
+    FILTROS_PDET
 )
 
 
-@st.cache_data
+@st.cache_resource
 def cargar_geojson():
-    """Carga datos GeoJSON de Colombia desde URL pública"""
+    """
+    Carga datos GeoJSON de Colombia desde URL pública.
+    Compartido por todo el proceso: se lee una vez y no se copia en cada rerun.
+    """
     try:
         url = "https://gist.githubusercontent.com/john-guerra/43c7656821069d00dcbc/raw/be6a6e239cd5b5b803c6e7c2ec405b793a9064dd/Colombia.geo.json"
         response = requests.get(url)
@@ -23,9 +27,12 @@ def cargar_geojson():
         return None
 
 
-@st.cache_data
+@st.cache_resource
 def cargar_geojson_municipios():
-    """Carga GeoJSON de municipios desde archivo local"""
+    """
+    Carga GeoJSON de municipios desde archivo local.
+    Compartido por todo el proceso: se lee una vez y no se copia en cada rerun.
+    """
     try:
         import json
 
@@ -71,7 +78,7 @@ def render_vista_general(metadatos, geojson_data=None, dept_data=None, umbral_si
 
     filtro_pdet = st.sidebar.selectbox(
         "Municipios PDET:",
-        options=["Todos", "Solo PDET", "Solo No PDET"],
+        options=list(FILTROS_PDET),
         index=0,
         help="Programa de Desarrollo con Enfoque Territorial"
     )
@@ -5,10 +5,13 @@ import io
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment
 from data_client import (
+    MUNICIPAL_VIEW_COLUMNS,
     consultar_datos_filtrados,
+    obtener_resumen_comparativo,
     obtener_ranking_municipio_especifico,
     obtener_todos_los_municipios,
-    obtener_todos_los_departamentos
+    obtener_todos_los_departamentos,
+    obtener_municipios_por_departamento
 )
 
 
@@ -92,14 +95,11 @@ def render_ficha_municipal():
 
     # Filtro municipio - siempre mostrar todos los disponibles
     if selected_department == 'Todos':
-        municipios_disponibles = todos_municipios_df['Municipio'].unique().tolist()
+        municipios_disponibles = sorted(todos_municipios_df['Municipio'].unique().tolist())
     else:
-        dpto_municipios = todos_municipios_df[
-            todos_municipios_df['Departamento'] == selected_department
-            ]['Municipio'].tolist()
-        municipios_disponibles = dpto_municipios
+        municipios_disponibles = obtener_municipios_por_departamento().get(selected_department, [])
 
-    municipios_lista = ['Todos'] + sorted(municipios_disponibles)
+    municipios_lista = ['Todos'] + municipios_disponibles
 
     selected_municipality = st.sidebar.selectbox(
         "Municipio:",
@@ -124,19 +124,25 @@ def render_ficha_municipal():
         help="Filtrar para incluir solo contenido clasificado como política pública"
     )
 
+    # Vista comparativa: solo métricas agregadas, sin traer las oraciones
+    if selected_municipality == 'Todos':
+        _render_vista_comparativa(selected_department, sentence_threshold, include_policy_only)
+        return
+
     # Obtener datos filtrados
     datos_filtrados = consultar_datos_filtrados(
         umbral_similitud=sentence_threshold,
         departamento=selected_department if selected_department != 'Todos' else None,
-        municipio=selected_municipality if selected_municipality != 'Todos' else None,
-        solo_politica_publica=include_policy_only
+        municipio=selected_municipality,
+        solo_politica_publica=include_policy_only,
+        columns=MUNICIPAL_VIEW_COLUMNS
     )
 
     # SQL already filters by sentence_similarity >= threshold
     high_quality_sentences = datos_filtrados
 
     # Validación para municipio sin datos
-    if selected_municipality != 'Todos' and high_quality_sentences.empty:
+    if high_quality_sentences.empty:
         st.warning(f"""
         ⚠️ **Sin datos para mostrar**
 
@@ -150,18 +156,14 @@ def render_ficha_municipal():
         """)
         return
 
-    # Renderizar según selección
-    if selected_municipality != 'Todos':
-        _render_vista_municipio_especifico(
-            selected_municipality,
-            selected_department,
-            sentence_threshold,
-            include_policy_only,
-            datos_filtrados,
-            high_quality_sentences
-        )
-    else:
-        _render_vista_comparativa(selected_department, sentence_threshold, datos_filtrados)
+    _render_vista_municipio_especifico(
+        selected_municipality,
+        selected_department,
+        sentence_threshold,
+        include_policy_only,
+        datos_filtrados,
+        high_quality_sentences
+    )
 
 
 def _render_vista_municipio_especifico(municipio, departamento, sentence_threshold,
@@ -279,14 +281,14 @@ def _render_vista_municipio_especifico(municipio, departamento, sentence_thresho
     _render_diccionario_recomendaciones(datos_municipio, municipio, include_policy_only)
 
 
-def _render_vista_comparativa(selected_department, sentence_threshold, datos_comparativos):
+def _render_vista_comparativa(selected_department, sentence_threshold, include_policy_only):
     """
     Renderiza vista comparativa de múltiples municipios
 
     Args:
         selected_department: Departamento seleccionado
         sentence_threshold: Umbral de similitud
-        datos_comparativos: Datos para comparación
+        include_policy_only: Si filtrar solo política pública
     """
 
     st.markdown(f"""
@@ -301,7 +303,14 @@ def _render_vista_comparativa(selected_department, sentence_threshold, datos_com
     </div>
     """, unsafe_allow_html=True)
 
-    if datos_comparativos.empty:
+    # Conteos calculados en DuckDB (sin cargar oraciones en pandas)
+    resumen = obtener_resumen_comparativo(
+        umbral_similitud=sentence_threshold,
+        departamento=selected_department if selected_department != 'Todos' else None,
+        solo_politica_publica=include_policy_only
+    )
+
+    if not resumen.get('total_registros'):
         st.warning("No hay datos disponibles con los filtros actuales")
         return
 
@@ -309,14 +318,13 @@ def _render_vista_comparativa(selected_department, sentence_threshold, datos_com
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        st.metric("Municipios", datos_comparativos['mpio'].nunique())
+        st.metric("Municipios", resumen['total_municipios'])
     with col2:
-        st.metric("Departamentos", datos_comparativos['dpto'].nunique())
+        st.metric("Departamentos", resumen['total_departamentos'])
     with col3:
-        st.metric("Recomendaciones", datos_comparativos['recommendation_code'].nunique())
+        st.metric("Recomendaciones", resumen['total_recomendaciones'])
     with col4:
-        avg_similarity = datos_comparativos['sentence_similarity'].mean()
-        st.metric("Similitud Promedio", f"{avg_similarity:.3f}")
+        st.metric("Similitud Promedio", f"{resumen['similitud_promedio']:.3f}")
 
     st.info("💡 Seleccione un municipio específico para ver el reporte detallado")
 